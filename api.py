@@ -1,59 +1,176 @@
 import os
+
+# ✅ Pin BLAS / OpenMP / tokenizer threads before numpy and torch are imported.
+# WEB_CONCURRENCY is also uvicorn's default for --workers, so set it instead of passing --workers.
+# Each of the MODEL_EXECUTOR_THREADS encode threads gets its own intra-op team, so split cores across both.
+WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+MODEL_EXECUTOR_THREADS = 4
+NUM_THREADS = max(1, (os.cpu_count() or 1) // (WORKERS * MODEL_EXECUTOR_THREADS))
+os.environ.setdefault("OMP_NUM_THREADS", str(NUM_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(NUM_THREADS))
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+import asyncio
+import hashlib
 import logging
 import inspect
+import functools
+import threading
+import collections
+from types import MappingProxyType
+from typing import Any
+from contextlib import asynccontextmanager, suppress
+from concurrent.futures import ThreadPoolExecutor
 import chromadb
-import uvicorn
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import numpy as np
+import torch
+from fastapi import BackgroundTasks, FastAPI, HTTPException
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, ValidationError, create_model
 from sentence_transformers import SentenceTransformer
 import automation_functions  # Importing function file
+from function_registry import COLLECTION_NAME, DB_PATH, register_functions
+from onnx_embedder import ONNX_MODEL_DIR, OnnxEmbedder
 from code_generator import generate_code  # Ensure this file exists
 
 # ✅ Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# ✅ Initialize FastAPI
-app = FastAPI()
-
-# ✅ Load Sentence Transformer model
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-
-# ✅ Initialize ChromaDB
-chroma_client = chromadb.PersistentClient(path="./function_db")
-collection = chroma_client.get_or_create_collection(name="functions")
-
-# ✅ Fetch available functions dynamically
-def get_available_functions():
-    """Retrieves all available functions in automation_functions.py."""
-    return {name: func for name, func in inspect.getmembers(automation_functions, inspect.isfunction)}
-
-ALLOWED_FUNCTIONS = get_available_functions()
+_torch_threads_pinned = False
+
+def pin_torch_threads():
+    """Sizes torch's thread pools once per process (set_num_interop_threads may only be called once)."""
+    global _torch_threads_pinned
+    if _torch_threads_pinned:
+        return
+    torch.set_num_threads(NUM_THREADS)
+    torch.set_num_interop_threads(1)
+    _torch_threads_pinned = True
+
+# ✅ Run blocking calls off the event loop
+async def run_blocking(fn, *args, executor=None, **kwargs):
+    """Runs a blocking call in a worker thread so the event loop stays free."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+# ✅ Sentence Transformer model (loaded once per process)
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+
+@functools.lru_cache(maxsize=1)
+def get_embedder():
+    """Returns the shared embedder, preferring the INT8 ONNX export when available."""
+    if os.path.isdir(ONNX_MODEL_DIR):
+        logging.info(f"⚡ Using ONNX Runtime model from {ONNX_MODEL_DIR}")
+        return OnnxEmbedder(ONNX_MODEL_DIR, num_threads=NUM_THREADS)
+    logging.warning("⚠️ ONNX model not found, falling back to Sentence Transformer (run onnx_embedder.py to export).")
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+def get_embedder_id():
+    """Identifies the model behind get_embedder(), so stored vectors from another model get replaced."""
+    embedder = get_embedder()
+    source = ONNX_MODEL_DIR if isinstance(embedder, OnnxEmbedder) else EMBEDDING_MODEL
+    return f"{type(embedder).__name__}:{source}"
+
+# ✅ ChromaDB client (opened once per process)
+@functools.lru_cache(maxsize=1)
+def get_chroma():
+    """Returns the shared ChromaDB client."""
+    return chromadb.PersistentClient(path=DB_PATH)
+
+def get_collection():
+    """Returns the collection holding the function embeddings."""
+    return get_chroma().get_or_create_collection(name=COLLECTION_NAME)
+
+# ✅ Read-only registry of the functions exported by automation_functions.py
+ALLOWED_FUNCTIONS = MappingProxyType({
+    name: getattr(automation_functions, name) for name in automation_functions.__all__
+})
 logging.info(f"✅ Loaded Functions: {list(ALLOWED_FUNCTIONS.keys())}")
 
-# ✅ Function to clear old function records and store new ones in ChromaDB
-def clear_and_store_functions():
-    function_names = list(ALLOWED_FUNCTIONS.keys())  # Get function names
-    
-    # ✅ Delete old embeddings
-    try:
-        existing_records = collection.get()["ids"]
-        if existing_records:
-            collection.delete(ids=existing_records)  # Delete old embeddings
-            logging.info(f"🗑️ Deleted {len(existing_records)} old records from ChromaDB.")
-    except Exception as e:
-        logging.warning(f"⚠️ No existing records found to delete: {str(e)}")
+# ✅ Parameter schema per function, generated from its signature
+PARAM_CONFIG = ConfigDict(extra="forbid", str_strip_whitespace=True, arbitrary_types_allowed=False)
 
-    # ✅ Encode and store new functions
-    function_embeddings = embedding_model.encode(function_names).tolist()
-    collection.add(ids=function_names, embeddings=function_embeddings)
-    
-    logging.info(f"🔄 Stored {len(function_names)} functions in the database.")
+def build_param_model(name, func):
+    """Creates a Pydantic model mirroring the function's parameters."""
+    fields = {}
+    for param in inspect.signature(func).parameters.values():
+        if param.default is inspect.Parameter.empty:
+            annotation = Any if param.annotation is inspect.Parameter.empty else param.annotation
+            fields[param.name] = (annotation, ...)
+        else:
+            annotation = type(param.default) if param.annotation is inspect.Parameter.empty else param.annotation
+            fields[param.name] = (annotation, param.default)
+    return create_model(f"{name}_params", __config__=PARAM_CONFIG, **fields)
+
+PARAM_MODELS = MappingProxyType({name: build_param_model(name, func) for name, func in ALLOWED_FUNCTIONS.items()})
+
+# ✅ Functions that only launch an application run after the response is sent
+BACKGROUND_FUNCTIONS = frozenset({"open_chrome", "open_calculator", "open_notepad"})
+BACKGROUND_OUTPUT = "Started in background"
+
+# ✅ Functions that only format the sampler's cached readings run inline, without a thread handoff
+CHEAP_FUNCTIONS = frozenset({"get_cpu_usage", "get_ram_usage"})
+
+# ✅ Generated code only depends on the function name, so build it once
+CODE_CACHE = {name: generate_code(name) for name in ALLOWED_FUNCTIONS}
+
+# ✅ In-process copy of the function embeddings used for routing (ChromaDB only persists them).
+# Kept as float32: numpy only sends float32/float64 matmuls through BLAS, float16 falls back to a slow loop.
+FN_NAMES = []
+FN_MAT = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+
+def load_function_matrix(names, embeddings):
+    """Normalizes function embeddings into the in-process routing matrix."""
+    global FN_NAMES, FN_MAT
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    FN_NAMES = list(names)
+    FN_MAT = np.ascontiguousarray(embeddings / np.maximum(norms, 1e-12))
+
+# ✅ Background CPU / RAM sampler
+SYSTEM_SAMPLE_INTERVAL = 1.0
+
+async def sample_system_usage_forever():
+    while True:
+        automation_functions.sample_system_usage()
+        await asyncio.sleep(SYSTEM_SAMPLE_INTERVAL)
+
+# ✅ Startup / shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pin_torch_threads()
+    app.state.executor = ThreadPoolExecutor(max_workers=MODEL_EXECUTOR_THREADS, thread_name_prefix="embedding")
+    app.state.embedder = get_embedder()
+    app.state.chroma = get_chroma()
+
+    # The registry lock and hash check make sure only the first worker actually re-embeds them
+    register_functions(app.state.chroma, app.state.embedder, ALLOWED_FUNCTIONS, get_embedder_id())
+
+    app.state.collection = get_collection()
+    stored = app.state.collection.get(include=["embeddings"])
+    load_function_matrix(stored["ids"], stored["embeddings"])
+
+    # Warm up the model so the first real request isn't cold
+    app.state.embedder.encode(["warmup"])
+
+    sampler = asyncio.create_task(sample_system_usage_forever())
+    yield
+    sampler.cancel()
+    with suppress(asyncio.CancelledError):
+        await sampler
+    app.state.executor.shutdown(wait=False)
 
-# ✅ Run function at startup
-clear_and_store_functions()
+# ✅ Initialize FastAPI
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
-# ✅ Session Memory for Context Retention
+# ✅ Session Memory for Context Retention: session_id -> deque[(prompt, embedding)]
+SESSION_HISTORY_SIZE = 200
 session_memory = {}
+session_seen = {}  # session_id -> set of prompts currently in session_memory
+_session_lock = threading.Lock()  # Touched from both model executor threads and the event loop
 
 # ✅ API Request Models
 class FunctionRequest(BaseModel):
@@ -66,38 +183,118 @@ class MultiFunctionRequest(BaseModel):
     session_id: str
 
 # ✅ Similarity Threshold for Function Matching
-SIMILARITY_THRESHOLD = 0.45
-
-# ✅ Retrieve Best Matching Function
-def retrieve_best_function(prompt: str, session_id: str):
-    """Retrieve the best function using similarity search and session history."""
-    embedding = embedding_model.encode(prompt).tolist()
-
-    # Store session history
-    session_memory.setdefault(session_id, [])
-    if prompt not in session_memory[session_id]:
-        session_memory[session_id].append(prompt)
-
-    results = collection.query(
-        query_embeddings=[embedding],
-        n_results=1,
-        include=["distances"]
-    )
-
-    if not results or not results["ids"] or not results["ids"][0]:
-        logging.warning("⚠️ No matching function found in the database.")
-        return None
-
-    best_match_id = results["ids"][0][0]
-    best_match_score = results["distances"][0][0]
-
-    logging.info(f"🔍 Best match: {best_match_id} (Score: {best_match_score})")
-
-    if best_match_score > SIMILARITY_THRESHOLD:
-        logging.warning("⚠️ No function meets the similarity threshold.")
-        return None  
-
-    return best_match_id
+# Maximum cosine distance (1 - cosine similarity) between a prompt and its function.
+# 0.225 matches the previous cut-off of 0.45 squared-L2 distance between unit vectors.
+SIMILARITY_THRESHOLD = 0.225
+
+# ✅ Store session history
+def remember_prompt(prompt: str, session_id: str, embedding: np.ndarray):
+    with _session_lock:
+        history = session_memory.setdefault(session_id, collections.deque(maxlen=SESSION_HISTORY_SIZE))
+        seen = session_seen.setdefault(session_id, set())
+        if prompt in seen:
+            return
+        if len(history) == history.maxlen:
+            seen.discard(history[0][0])  # About to be evicted by the append
+        history.append((prompt, embedding))
+        seen.add(prompt)
+
+def session_history(session_id: str):
+    """Returns the prompts seen in a session, oldest first."""
+    with _session_lock:
+        return [prompt for prompt, _ in session_memory.get(session_id, [])]
+
+# ✅ Prompt Cache (exact match + embedding LRU)
+CACHE_SIZE = 1024
+EMBEDDING_CACHE_SIZE = 10_000
+
+_EMBEDDINGS = collections.OrderedDict()  # blake2b(normalized prompt) -> embedding
+
+_EXACT = collections.OrderedDict()  # prompt -> (function_name, embedding)
+_cache_lock = threading.Lock()
+
+def _prompt_key(prompt: str) -> bytes:
+    """Hashes the prompt after lowercasing and collapsing whitespace."""
+    normalized = " ".join(prompt.lower().split())
+    return hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+
+def encode_prompts(embedder, prompts: list[str]) -> np.ndarray:
+    """Returns normalized float32 embeddings, only running the model for unseen prompts."""
+    keys = [_prompt_key(prompt) for prompt in prompts]
+    embeddings = np.empty((len(prompts), EMBEDDING_DIM), dtype=np.float32)
+
+    missing = []
+    with _cache_lock:
+        for i, key in enumerate(keys):
+            if key in _EMBEDDINGS:
+                _EMBEDDINGS.move_to_end(key)
+                embeddings[i] = _EMBEDDINGS[key]
+            else:
+                missing.append(i)
+
+    if missing:
+        encoded = embedder.encode(
+            [prompts[i] for i in missing], batch_size=32, convert_to_numpy=True, normalize_embeddings=True
+        )
+        with _cache_lock:
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding
+                _EMBEDDINGS[keys[i]] = embeddings[i].copy()
+                if len(_EMBEDDINGS) > EMBEDDING_CACHE_SIZE:
+                    _EMBEDDINGS.popitem(last=False)
+
+    return embeddings
+
+def _cache_get(prompt: str):
+    """Returns the cached (function_name, embedding) for an exact prompt match."""
+    with _cache_lock:
+        if prompt not in _EXACT:
+            return None
+        _EXACT.move_to_end(prompt)
+        return _EXACT[prompt]
+
+def _cache_store(prompt: str, function_name: str, embedding: np.ndarray):
+    """Records a resolved prompt in the exact-match cache."""
+    with _cache_lock:
+        _EXACT[prompt] = (function_name, embedding)
+        if len(_EXACT) > CACHE_SIZE:
+            _EXACT.popitem(last=False)
+
+# ✅ Match query embeddings against the function registry
+def match_functions(embeddings: np.ndarray):
+    """Returns a (function_name, cosine distance) pair for each normalized query embedding."""
+    if not FN_NAMES:
+        return [(None, None)] * len(embeddings)
+    sims = embeddings @ FN_MAT.T  # Cosine similarity, since both sides are unit vectors
+    best = sims.argmax(axis=1)
+    return [(FN_NAMES[i], 1.0 - float(sims[row, i])) for row, i in enumerate(best)]
+
+# ✅ Retrieve Best Matching Functions (shared by both endpoints)
+def retrieve_best_functions(prompts: list[str], session_id: str, embedder):
+    """Routes each prompt to its best function (None below the threshold) and records session history."""
+    resolved = [_cache_get(prompt) for prompt in prompts]
+    missing = [i for i, hit in enumerate(resolved) if hit is None]
+
+    if missing:
+        embeddings = encode_prompts(embedder, [prompts[i] for i in missing])
+        for i, embedding, (best_match_id, best_match_score) in zip(missing, embeddings, match_functions(embeddings)):
+            if best_match_id is None:
+                logging.warning("⚠️ No matching function found in the database.")
+                resolved[i] = (None, embedding)
+                continue
+
+            logging.info(f"🔍 Best match for '{prompts[i]}': {best_match_id} (Score: {best_match_score})")
+            function_name = best_match_id
+            if best_match_score > SIMILARITY_THRESHOLD:
+                logging.warning("⚠️ No function meets the similarity threshold.")
+                function_name = None
+
+            _cache_store(prompts[i], function_name, embedding)
+            resolved[i] = (function_name, embedding)
+
+    for prompt, (_, embedding) in zip(prompts, resolved):
+        remember_prompt(prompt, session_id, embedding)
+    return [function_name for function_name, _ in resolved]
 
 # ✅ Secure Function Execution
 def execute_function(function_name: str, params: dict = None):
@@ -124,21 +321,37 @@ def execute_function(function_name: str, params: dict = None):
 
 # ✅ API Endpoint for Single Execution
 @app.post("/execute")
-async def execute(request: FunctionRequest):
+async def execute(request: FunctionRequest, background_tasks: BackgroundTasks):
     logging.info(f"📩 Received request: {request.prompt}, Session ID: {request.session_id}")
     
-    function_name = retrieve_best_function(request.prompt, request.session_id)
+    function_names = await run_blocking(
+        retrieve_best_functions, [request.prompt], request.session_id, app.state.embedder,
+        executor=app.state.executor
+    )
+    function_name = function_names[0]
     if not function_name:
         raise HTTPException(status_code=404, detail="No matching function found")
 
-    output = execute_function(function_name, request.params)  # ✅ Pass parameters
-    generated_code = generate_code(function_name)
+    # ✅ Validate parameters against the function's signature before running it
+    try:
+        params = PARAM_MODELS[function_name].model_validate(request.params or {}).model_dump()
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+
+    if function_name in BACKGROUND_FUNCTIONS:
+        background_tasks.add_task(execute_function, function_name, params)
+        output = BACKGROUND_OUTPUT
+    elif function_name in CHEAP_FUNCTIONS:
+        output = execute_function(function_name, params)
+    else:
+        output = await run_blocking(execute_function, function_name, params)  # ✅ Pass parameters
+    generated_code = CODE_CACHE[function_name]
 
     response = {
         "function": function_name,
         "output": output,
         "code": generated_code,
-        "session_history": session_memory.get(request.session_id, [])
+        "session_history": session_history(request.session_id)
     }
 
     logging.info(f"✅ Executed: {function_name}, Output: {output}")
@@ -146,15 +359,29 @@ async def execute(request: FunctionRequest):
 
 # ✅ API Endpoint for Multi-Step Execution
 @app.post("/execute_multiple")
-async def execute_multiple(request: MultiFunctionRequest):
+async def execute_multiple(request: MultiFunctionRequest, background_tasks: BackgroundTasks):
     logging.info(f"📩 Received multiple prompts: {request.prompts}, Session ID: {request.session_id}")
 
+    if not request.prompts:
+        return {"session_history": session_history(request.session_id), "results": []}
+
+    # ✅ Encode all uncached prompts in one forward pass and match them in one call
+    function_names = await run_blocking(
+        retrieve_best_functions, request.prompts, request.session_id, app.state.embedder,
+        executor=app.state.executor
+    )
+
     results = []
-    for prompt in request.prompts:
-        function_name = retrieve_best_function(prompt, request.session_id)
+    for function_name in function_names:
         if function_name:
-            output = execute_function(function_name)
-            generated_code = generate_code(function_name)
+            if function_name in BACKGROUND_FUNCTIONS:
+                background_tasks.add_task(execute_function, function_name)
+                output = BACKGROUND_OUTPUT
+            elif function_name in CHEAP_FUNCTIONS:
+                output = execute_function(function_name)
+            else:
+                output = await run_blocking(execute_function, function_name)
+            generated_code = CODE_CACHE[function_name]
             results.append({
                 "function": function_name,
                 "output": output,
@@ -168,10 +395,6 @@ async def execute_multiple(request: MultiFunctionRequest):
             })
 
     return {
-        "session_history": session_memory.get(request.session_id, []),
+        "session_history": session_history(request.session_id),
         "results": results
     }
-
-# ✅ Run API
-if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8000)
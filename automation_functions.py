@@ -3,23 +3,48 @@ import webbrowser
 import psutil
 import subprocess
 
+__all__ = [
+    "open_chrome",
+    "open_calculator",
+    "open_notepad",
+    "get_cpu_usage",
+    "get_ram_usage",
+    "list_files",
+]
+
 # ✅ Application Control
 def open_chrome():
     webbrowser.open("https://www.google.com")
 
 def open_calculator():
-    os.system("calc")
+    subprocess.Popen(["calc"], close_fds=True)
 
 def open_notepad():
-    os.system("notepad")
+    subprocess.Popen(["notepad"], close_fds=True)
+
+# ✅ System Monitoring (readings refreshed by the API's background sampler)
+LATEST_CPU = None
+LATEST_RAM = None
+CPU_FALLBACK_INTERVAL = 0.1
+
+psutil.cpu_percent(interval=None)  # Prime the counter; the first non-blocking reading is always 0.0
+
+def sample_system_usage():
+    """Refreshes the cached CPU and RAM readings."""
+    global LATEST_CPU, LATEST_RAM
+    LATEST_CPU = psutil.cpu_percent(interval=None)
+    LATEST_RAM = psutil.virtual_memory().percent
 
-# ✅ System Monitoring
 def get_cpu_usage():
-    return f"CPU Usage: {psutil.cpu_percent()}%"
+    if LATEST_CPU is None:
+        # No sampler running (e.g. a generated script): take a short blocking reading instead
+        return f"CPU Usage: {psutil.cpu_percent(interval=CPU_FALLBACK_INTERVAL)}%"
+    return f"CPU Usage: {LATEST_CPU}%"
 
 def get_ram_usage():
-    ram = psutil.virtual_memory()
-    return f"RAM Usage: {ram.percent}%"
+    if LATEST_RAM is None:
+        return f"RAM Usage: {psutil.virtual_memory().percent}%"
+    return f"RAM Usage: {LATEST_RAM}%"
 
 
 def list_files(directory="."):
@@ -1,11 +1,12 @@
 import chromadb
+from function_registry import COLLECTION_NAME, DB_PATH
 
 # Initialize ChromaDB
-chroma_client = chromadb.PersistentClient(path="./function_db")
-collection = chroma_client.get_or_create_collection(name="functions")
+chroma_client = chromadb.PersistentClient(path=DB_PATH)
+collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
 
 # Get all stored function IDs
-stored_functions = collection.get()
+stored_functions = collection.get(include=[])  # Only the ids are needed
 
 # Print stored function IDs
 print("Stored function IDs:", stored_functions["ids"])
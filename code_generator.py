@@ -1,3 +1,6 @@
+import functools
+
+@functools.lru_cache(maxsize=64)
 def generate_code(function_name):
     """Generates Python code to execute a function."""
     return f'''
@@ -1,33 +1,64 @@
-import chromadb
-import inspect
-import automation_functions
-from sentence_transformers import SentenceTransformer
-
-# ✅ Load Sentence Transformer model
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-
-# ✅ Initialize ChromaDB
-chroma_client = chromadb.PersistentClient(path="./function_db")
-collection = chroma_client.get_or_create_collection(name="functions")
-
-# ✅ Clear previous function entries to avoid duplication
-existing_ids = collection.get()["ids"]
-if existing_ids:
-    collection.delete(ids=existing_ids)
-
-# ✅ Automatically fetch available functions from automation.py
-FUNCTIONS = {
-    name: func.__doc__ or "No description available"
-    for name, func in inspect.getmembers(automation, inspect.isfunction)
-}
-
-# ✅ Store function embeddings in ChromaDB
-for function_name, description in FUNCTIONS.items():
-    embedding = embedding_model.encode(description).tolist()
-    collection.add(
-        ids=[function_name],
-        embeddings=[embedding],
-        metadatas=[{"description": description}]
-    )
-
-print("✅ Function embeddings stored successfully!")
+import os
+import hashlib
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, registration is not serialized across processes
+    fcntl = None
+
+# ✅ Collection holding one embedding per allowed function
+DB_PATH = "./function_db"
+COLLECTION_NAME = "functions"
+REGISTRY_HASH_KEY = "registry_hash"
+DISTANCE_METRIC = "cosine"  # Embeddings are L2-normalized, so cosine distance = 1 - dot product
+
+def registry_hash(functions: dict, embedder_id: str) -> str:
+    """Fingerprints the registry from the embedded function names and the model that embedded them."""
+    entries = [embedder_id, *sorted(functions)]
+    return hashlib.sha256("\n".join(entries).encode()).hexdigest()
+
+@contextmanager
+def registry_lock(db_path=DB_PATH):
+    """Holds an exclusive file lock so only one process (re)embeds the registry at a time."""
+    os.makedirs(db_path, exist_ok=True)
+    with open(os.path.join(db_path, ".lock"), "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def register_functions(client, embedder, functions: dict, embedder_id: str) -> None:
+    """Stores function embeddings in ChromaDB, skipping the work when the registry is unchanged."""
+    with registry_lock():
+        _register_functions(client, embedder, functions, embedder_id)
+
+def _register_functions(client, embedder, functions: dict, embedder_id: str) -> None:
+    signature = registry_hash(functions, embedder_id)
+    metadata = {"hnsw:space": DISTANCE_METRIC, REGISTRY_HASH_KEY: signature}
+    collection = client.get_or_create_collection(name=COLLECTION_NAME)
+
+    if collection.metadata == metadata and collection.count() == len(functions):
+        logging.info("✅ Function registry unchanged, skipping re-embedding.")
+        return
+
+    # ✅ Recreate the collection so stale records and the old hash go away together
+    client.delete_collection(name=COLLECTION_NAME)
+    collection = client.create_collection(name=COLLECTION_NAME, metadata=metadata)
+
+    # ✅ Encode and store new functions
+    function_names = list(functions)
+    function_embeddings = embedder.encode(function_names, normalize_embeddings=True).tolist()
+    collection.add(ids=function_names, embeddings=function_embeddings)
+
+    logging.info(f"🔄 Stored {len(function_names)} functions in the database.")
+
+if __name__ == "__main__":
+    from api import ALLOWED_FUNCTIONS, get_chroma, get_embedder, get_embedder_id
+
+    register_functions(get_chroma(), get_embedder(), ALLOWED_FUNCTIONS, get_embedder_id())
+    print("✅ Function embeddings stored successfully!")
@@ -0,0 +1,82 @@
+import os
+import logging
+import numpy as np
+
+# ✅ Location of the exported INT8 model
+ONNX_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+ONNX_MODEL_DIR = "./onnx_model"
+ONNX_MODEL_FILE = "model_quantized.onnx"
+MAX_SEQ_LENGTH = 256
+
+# ✅ One-time export: ONNX + dynamic INT8 quantization
+def export_quantized_model(model_id=ONNX_MODEL_ID, output_dir=ONNX_MODEL_DIR):
+    """Exports the Sentence Transformer to ONNX and quantizes it to INT8."""
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    export_dir = f"{output_dir}_fp32"
+    ORTModelForFeatureExtraction.from_pretrained(model_id, export=True).save_pretrained(export_dir)
+    AutoTokenizer.from_pretrained(model_id).save_pretrained(output_dir)
+
+    quantizer = ORTQuantizer.from_pretrained(export_dir)
+    qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=output_dir, quantization_config=qconfig)
+    logging.info(f"✅ Exported INT8 model to {output_dir}")
+
+# ✅ Drop-in replacement for SentenceTransformer.encode
+class OnnxEmbedder:
+    """Runs the quantized model with ONNX Runtime and reproduces mean pooling + L2 norm."""
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, num_threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, ONNX_MODEL_FILE), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def _embed_batch(self, sentences):
+        tokens = self.tokenizer(
+            sentences, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH, return_tensors="np"
+        )
+        # Contiguous int64 arrays are handed to ORT without an extra copy
+        inputs = {name: np.ascontiguousarray(tokens[name], dtype=np.int64) for name in self.input_names}
+        hidden = self.session.run(None, inputs)[0]
+
+        mask = tokens["attention_mask"][..., np.newaxis].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        """Encodes one sentence or a list of sentences into float32 embeddings."""
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        batches = [
+            self._embed_batch(sentences[start:start + batch_size])
+            for start in range(0, len(sentences), batch_size)
+        ]
+        embeddings = np.concatenate(batches) if batches else np.empty((0, self.dimension))
+        embeddings = embeddings.astype(np.float32)
+
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.maximum(norms, 1e-12)
+
+        return embeddings[0] if single else embeddings
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    export_quantized_model()
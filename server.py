@@ -0,0 +1,21 @@
+import os
+import sys
+import uvicorn
+
+# ✅ Launcher kept out of api.py: spawned uvicorn workers re-run the main module,
+# and api.py must only be imported once per process. It is not imported here at all,
+# so the supervisor never loads torch. Each worker registers the functions in its
+# lifespan; the registry lock lets only the first one embed them.
+if __name__ == "__main__":
+    # One worker by default: session memory and prompt caches live in each process,
+    # so extra workers (WEB_CONCURRENCY=N) split a session's history between them
+    uvicorn.run(
+        "api:app",
+        host="127.0.0.1",
+        port=8000,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",  # uvloop has no Windows support
+        http="httptools",
+        workers=max(1, int(os.environ.get("WEB_CONCURRENCY", "1"))),
+        limit_concurrency=1000,
+        timeout_keep_alive=30,
+    )